@@ -1,11 +1,14 @@
-import json
 from datetime import datetime, UTC
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import streamlit as st
+import streamlit.components.v1 as components
+import orjson
 import folium
-from streamlit_folium import st_folium
+import xyzservices
+from folium.plugins import FastMarkerCluster
 
 # ----------------------
 # Files
@@ -17,6 +20,44 @@ NON_SOTA_MUNROS_FILE = Path("non-sota-munros.json")
 CORBETTS_FILE = Path("corbetts.csv")
 CAIRNGORMS_FILE = Path("cairngorms_summits.csv")
 
+# ----------------------
+# Map styling
+# ----------------------
+
+MAP_HEIGHT = 700
+MAP_ZOOM = 7
+
+# Marker colour indexed by summit points (0-10); anything else falls back to red
+COLOR_LUT = np.array([
+    "red",         # 0
+    "lightgreen",  # 1
+    "green",       # 2
+    "red",         # 3
+    "darkgreen",   # 4
+    "red",         # 5
+    "orange",      # 6
+    "red",         # 7
+    "darkred",     # 8
+    "red",         # 9
+    "red",         # 10
+])
+
+# Builds one summit marker from a [lat, lon, popup, tooltip, color] row
+SUMMIT_MARKER_CALLBACK = """
+function (row) {
+    var icon = L.AwesomeMarkers.icon({
+        markerColor: row[4],
+        iconColor: "white",
+        icon: "info-sign",
+        prefix: "glyphicon"
+    });
+    var marker = L.marker(new L.LatLng(row[0], row[1]), {icon: icon});
+    marker.bindPopup(row[2]);
+    marker.bindTooltip(row[3]);
+    return marker;
+};
+"""
+
 # ----------------------
 # Page config
 # ----------------------
@@ -35,8 +76,7 @@ st.caption("👈 Change filters in the sidebar to see different years and hills"
 
 @st.cache_data
 def load_json(path: Path, last_modified: float):
-    with path.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    return orjson.loads(path.read_bytes())
 
 @st.cache_data
 def load_csv(path: Path):
@@ -48,26 +88,41 @@ def load_csv(path: Path):
 
 @st.cache_data
 def build_activation_dataframe(data):
-    rows = []
+    summit_entries = [
+        summit_entry
+        for region in data["regions"].values()
+        for summit_entry in region["summits"].values()
+    ]
+
+    # One row per summit, repeated once per activation
+    summits = pd.DataFrame.from_records(
+        [summit_entry["summit"] for summit_entry in summit_entries],
+        columns=["summitCode", "name", "points", "latitude", "longitude"],
+    )
+    counts = [len(summit_entry["activations"]) for summit_entry in summit_entries]
+    summits = summits.loc[summits.index.repeat(counts)].reset_index(drop=True)
+
+    activations = [
+        act
+        for summit_entry in summit_entries
+        for act in summit_entry["activations"]
+    ]
+
+    df = pd.DataFrame({
+        "userId": [act["userId"] for act in activations],
+        "Callsign": [act.get("Callsign") for act in activations],
+        "activationDate": [act["activationDate"] for act in activations],
+    })
+    df["year"] = df["activationDate"].str.slice(0, 4).astype("int16")
 
-    for region in data["regions"].values():
-        for summit_entry in region["summits"].values():
-            summit = summit_entry["summit"]
+    df = pd.concat([df, summits], axis=1)
 
-            for act in summit_entry["activations"]:
-                rows.append({
-                    "userId": act["userId"],
-                    "Callsign": act.get("Callsign"),
-                    "activationDate": act["activationDate"],
-                    "year": int(act["activationDate"][:4]),
-                    "summitCode": summit["summitCode"],
-                    "name": summit["name"],
-                    "points": summit["points"],
-                    "latitude": summit["latitude"],
-                    "longitude": summit["longitude"],
-                })
+    # Repeated identifiers as categoricals so filters and groupbys work on integer codes
+    for col in ("userId", "Callsign", "summitCode", "name"):
+        df[col] = df[col].astype("category")
+    df["points"] = df["points"].astype("int8")
 
-    return pd.DataFrame(rows)
+    return df
 
 # ----------------------
 # Load all data
@@ -127,6 +182,65 @@ cairngorms = (
     })[["summitCode", "name", "latitude", "longitude", "points"]]
 )
 
+# Every summit code in one categorical dtype, so isin filters compare integer codes
+summit_code_dtype = pd.CategoricalDtype(sorted(
+    set(df["summitCode"].dropna()).union(
+        sota_munros["summitCode"].dropna(),
+        corbetts["summitCode"].dropna(),
+        cairngorms["summitCode"].dropna(),
+    )
+))
+
+df["summitCode"] = df["summitCode"].astype(summit_code_dtype)
+all_sota_summits = all_sota_summits.astype({"summitCode": summit_code_dtype})
+sota_munros = sota_munros.astype({"summitCode": summit_code_dtype})
+corbetts = corbetts.astype({"summitCode": summit_code_dtype})
+cairngorms = cairngorms.astype({"summitCode": summit_code_dtype})
+
+# ----------------------
+# Hillsets
+# ----------------------
+
+HILLSETS = [
+    "All Scotland",
+    "Region GM/ES",
+    "Region GM/WS",
+    "Region GM/NS",
+    "Region GM/CS",
+    "Region GM/SS",
+    "Region GM/SI",
+    "Munros",
+    "Corbetts",
+    "Cairngorms National Park"
+]
+
+@st.cache_data
+def hillset_catalogue(name: str, last_modified: float) -> tuple[pd.DataFrame, frozenset]:
+    if name == "All Scotland":
+        summits_df = all_sota_summits
+
+    elif name.startswith("Region"):
+        code = name.split("/")[-1]
+        summits_df = all_sota_summits[
+            all_sota_summits["summitCode"].str.startswith(f"GM/{code}")
+        ]
+
+    elif name == "Munros":
+        summits_df = sota_munros
+
+    elif name == "Corbetts":
+        summits_df = corbetts
+
+    elif name == "Cairngorms National Park":
+        summits_df = cairngorms
+
+    return summits_df, frozenset(summits_df["summitCode"].dropna())
+
+@st.cache_data
+def df_for_hillset(name: str, last_modified: float) -> pd.DataFrame:
+    _, codes = hillset_catalogue(name, last_modified)
+    return df[df["summitCode"].isin(codes)]
+
 # ----------------------
 # Filters
 # ----------------------
@@ -153,211 +267,224 @@ with st.sidebar:
 
     hillset = st.selectbox(
         "Hill set",
-        [
-            "All Scotland",
-            "Region GM/ES",
-            "Region GM/WS",
-            "Region GM/NS",
-            "Region GM/CS",
-            "Region GM/SS",
-            "Region GM/SI",
-            "Munros",
-            "Corbetts",
-            "Cairngorms National Park"
-        ]
+        HILLSETS
     )
 
-
 # ----------------------
-# Year filter
+# Precomputed tables
 # ----------------------
 
-if selected_year == "ALL":
-    df_year = df.copy()
-else:
-    df_year = df[df["year"] == selected_year]
+def compute_summary(name: str, year, last_modified: float) -> pd.DataFrame:
+    summits_df, _ = hillset_catalogue(name, last_modified)
+    df_hillset = df_for_hillset(name, last_modified)
 
-# ----------------------
-# Hillset summit catalogue
-# ----------------------
+    if year != "ALL":
+        df_hillset = df_hillset[df_hillset["year"] == year]
 
-if hillset == "All Scotland":
-    summits_df = all_sota_summits.copy()
+    summary = (
+        df_hillset
+        .drop_duplicates(subset=["userId", "summitCode"])
+        .value_counts(subset=["userId", "Callsign"])
+        .reset_index(name="Summits Activated")
+        .sort_values("Summits Activated", ascending=False)
+    )
 
-elif hillset.startswith("Region"):
-    code = hillset.split("/")[-1]
-    summits_df = all_sota_summits[
-        all_sota_summits["summitCode"].str.startswith(f"GM/{code}")
-    ]
+    total_summits = len(summits_df)
 
-elif hillset == "Munros":
-    summits_df = sota_munros.copy()
+    summary["% Complete"] = (summary["Summits Activated"] / total_summits * 100).round(0)
 
-elif hillset == "Corbetts":
-    summits_df = corbetts.copy()
+    return summary
 
-elif hillset == "Cairngorms National Park":
-    summits_df = cairngorms.copy()
+def compute_historical(name: str, last_modified: float) -> tuple[pd.DataFrame, pd.DataFrame]:
+    dedup = df_for_hillset(name, last_modified).drop_duplicates(subset=["userId", "summitCode", "year"])
 
-hillset_codes = set(summits_df["summitCode"].dropna())
+    historical = (
+        dedup
+        .value_counts(subset=["year", "Callsign"], sort=False)
+        .reset_index(name="Summits")
+    )
 
-df_hillset = df[df["summitCode"].isin(hillset_codes)]
+    top_idx = historical.groupby("year", sort=False)["Summits"].idxmax()
 
-# ----------------------
-# Activator summary table
-# ----------------------
-
-summary = (
-    df_year[df_year["summitCode"].isin(summits_df["summitCode"].dropna())]
-    .drop_duplicates(subset=["userId", "summitCode"])
-    .groupby(["userId", "Callsign"])
-    .size()
-    .reset_index(name="Summits Activated")
-    .sort_values("Summits Activated", ascending=False)
-)
+    top_per_year = (
+        historical
+        .loc[top_idx]
+        .sort_values("year", ascending=False)
+        .rename(columns={"year": "Year"})
+    )
 
-total_summits = len(summits_df)
+    yearly_totals = (
+        dedup
+        .value_counts(subset=["year"], sort=False)
+        .reset_index(name="Total Activations")
+    )
 
-summary["% Complete"] = (summary["Summits Activated"] / total_summits * 100).round(0)
+    return top_per_year, yearly_totals
 
-st.subheader("Summits activated by activator")
+# Held as shared resources: cache_data would unpickle the whole dict on every rerun.
+# Callers only read from these tables, so sharing them is safe.
+@st.cache_resource(max_entries=1)
+def all_summaries(last_modified: float) -> dict:
+    return {
+        (name, year): compute_summary(name, year, last_modified)
+        for name in HILLSETS
+        for year in year_options
+    }
 
-col_left, col_right = st.columns([0.7, 0.3])
+@st.cache_resource(max_entries=1)
+def all_historical(last_modified: float) -> dict:
+    return {name: compute_historical(name, last_modified) for name in HILLSETS}
 
-with col_left:
-    table_event = st.dataframe(
-        summary.drop(columns="userId"),
-        hide_index=True,
-        selection_mode="single-row",
-        on_select="rerun",
-        width="stretch"
-    )
+# ----------------------
+# Year filter
+# ----------------------
 
-with col_right:
-    st.metric("Total Summits Activated", int(summary["Summits Activated"].sum()), border=True)
-    st.metric("Total Activators", summary["Callsign"].nunique(), border=True)
+df_year = df if selected_year == "ALL" else df[df["year"] == selected_year]
 
 # ----------------------
-# Selected activator
+# Hillset summit catalogue
 # ----------------------
 
-selected_callsign = None
-if table_event and table_event.selection.rows:
-    selected_callsign = summary.iloc[table_event.selection.rows[0]]["Callsign"]
+summits_df, hillset_codes = hillset_catalogue(hillset, last_modified)
 
 # ----------------------
 # Maps
 # ----------------------
 
-st.subheader("Maps")
+@st.cache_resource
+def base_map_tiles() -> xyzservices.TileProvider:
+    # Shared across sessions; folium only reads from it, so no copy is needed
+    return xyzservices.providers.query_name("OpenTopoMap")
 
-if selected_callsign:
-    st.markdown(f"**Selected activator:** `{selected_callsign}`")
+def new_base_map() -> folium.Map:
+    return folium.Map(location=[56.8, -4.2], zoom_start=MAP_ZOOM, tiles=base_map_tiles())
 
-    df_call = (
-        df_year[
-            (df_year["Callsign"] == selected_callsign) &
-            (df_year["summitCode"].isin(summits_df["summitCode"].dropna()))
-        ]
-        .drop_duplicates(subset=["summitCode"])
-    )
+MAP_COLUMNS = ["latitude", "longitude", "name", "summitCode", "points"]
 
-    # ---- Activated map
-    m1 = folium.Map(location=[56.8, -4.2], zoom_start=7, tiles="OpenTopoMap")
+def map_rows(summits: pd.DataFrame) -> tuple:
+    return tuple(summits[MAP_COLUMNS].itertuples(index=False, name=None))
+
+# Bounded: each entry is a whole rendered map, and keys span callsign, hillset and year
+@st.cache_data(max_entries=64)
+def render_map_html(rows: tuple, show_non_sota_munros: bool = False) -> str:
+    summits = pd.DataFrame(list(rows), columns=MAP_COLUMNS)
 
-    for _, r in df_call.iterrows():
+    m = new_base_map()
 
-        popup = f"""
-        <b>{r['name']}</b><br>
-        {"<a href='https://sotl.as/summits/" + r['summitCode'] + "' target='_blank'>" + r['summitCode'] + "</a><br>" if pd.notna(r.get("summitCode")) else ""}
-        Points: {r.get('points', '—')}
-        """
+    points = np.clip(summits["points"].to_numpy(), 0, len(COLOR_LUT) - 1).astype(np.intp)
+    summits = summits.assign(color=COLOR_LUT[points])
 
-        tooltip = r["name"]
+    links = (
+        "<a href='https://sotl.as/summits/" + summits["summitCode"] + "' target='_blank'>"
+        + summits["summitCode"] + "</a><br>"
+    ).fillna("")
+    summits = summits.assign(
+        popup="<b>" + summits["name"] + "</b><br>" + links + "Points: " + summits["points"].astype(str)
+    )
 
-        points = r.get("points")
+    FastMarkerCluster(
+        summits[["latitude", "longitude", "popup", "name", "color"]].to_numpy().tolist(),
+        callback=SUMMIT_MARKER_CALLBACK,
+        # Show individual colour-coded pins from the opening zoom level
+        options={"disableClusteringAtZoom": MAP_ZOOM},
+    ).add_to(m)
 
-        color = (
-            "lightgreen" if points == 1 else
-            "green" if points == 2 else
-            "darkgreen" if points == 4 else
-            "orange" if points == 6 else
-            "darkred" if points == 8 else
-            "red"
-        )
+    if show_non_sota_munros:
+        for row in non_sota_munros.itertuples(index=False):
+            popup = f"<b>{row.name}</b><br>Elevation: {row.Elevation} m"
 
-        folium.Marker(
-            [r["latitude"], r["longitude"]],
-            popup=popup,
-            tooltip=tooltip,
-            icon=folium.Icon(color=color)
-        ).add_to(m1)
+            folium.CircleMarker(
+                location=[row.lat, row.lon],
+                popup=popup,
+                tooltip=row.name,
+                radius=5,
+                color="grey",
+                fill=True,
+                fill_color="grey",
+                fill_opacity=0.6,
+            ).add_to(m)
 
+    return m.get_root().render()
+
+def render_maps(df_call: pd.DataFrame, unactivated: pd.DataFrame | None, hillset: str):
+    # ---- Activated map
     st.markdown("### Activated summits")
-    st_folium(m1, width="stretch", returned_objects=[])
+    components.html(render_map_html(map_rows(df_call)), height=MAP_HEIGHT)
 
     # ---- Unactivated map
 
     st.subheader("Unactivated summits")
     st.info("Unactivated summits map is only available when ALL years are selected.")
 
-    if selected_year == "ALL" and selected_callsign:
-
-
-        activated_codes = set(df_call["summitCode"].dropna())
-        unactivated = summits_df[~summits_df["summitCode"].isin(activated_codes)]
+    if unactivated is not None:
+        components.html(
+            render_map_html(map_rows(unactivated), show_non_sota_munros=hillset == "Munros"),
+            height=MAP_HEIGHT
+        )
 
+# ----------------------
+# Activator summary table
+# ----------------------
 
-        m2 = folium.Map(location=[56.8, -4.2], zoom_start=7, tiles="OpenTopoMap")
+summary = all_summaries(last_modified)[(hillset, selected_year)]
+
+# Selecting an activator reruns only this fragment, not the filters or historical tables
+@st.fragment
+def activator_section(
+    summary: pd.DataFrame,
+    df_year: pd.DataFrame,
+    summits_df: pd.DataFrame,
+    hillset_codes: frozenset,
+    selected_year,
+    hillset: str
+):
+    st.subheader("Summits activated by activator")
+
+    col_left, col_right = st.columns([0.7, 0.3])
+
+    with col_left:
+        table_event = st.dataframe(
+            summary.drop(columns="userId"),
+            hide_index=True,
+            selection_mode="single-row",
+            on_select="rerun",
+            width="stretch"
+        )
 
-        for _, r in unactivated.iterrows():
+    with col_right:
+        st.metric("Total Summits Activated", int(summary["Summits Activated"].sum()), border=True)
+        st.metric("Total Activators", summary["Callsign"].nunique(), border=True)
 
-            popup = f"""
-            <b>{r['name']}</b><br>
-            {"<a href='https://sotl.as/summits/" + r['summitCode'] + "' target='_blank'>" + r['summitCode'] + "</a><br>" if pd.notna(r.get("summitCode")) else ""}
-            Points: {r.get('points', '—')}
-            """
+    # ---- Selected activator
 
-            tooltip = r["name"]
+    selected_callsign = None
+    if table_event and table_event.selection.rows:
+        selected_callsign = summary.iloc[table_event.selection.rows[0]]["Callsign"]
 
-            points = r.get("points")
+    st.subheader("Maps")
 
-            color = (
-                "lightgreen" if points == 1 else
-                "green" if points == 2 else
-                "darkgreen" if points == 4 else
-                "orange" if points == 6 else
-                "darkred" if points == 8 else
-                "red"
-            )
+    if selected_callsign:
+        st.markdown(f"**Selected activator:** `{selected_callsign}`")
 
-            folium.Marker(
-                [r["latitude"], r["longitude"]],
-                popup=popup,
-                tooltip=tooltip,
-                icon=folium.Icon(color=color)
-            ).add_to(m2)
+        df_call = (
+            df_year[
+                (df_year["Callsign"] == selected_callsign) &
+                (df_year["summitCode"].isin(hillset_codes))
+            ]
+            .drop_duplicates(subset=["summitCode"])
+        )
 
+        unactivated = None
+        if selected_year == "ALL":
+            activated_codes = set(df_call["summitCode"].dropna())
+            unactivated = summits_df[~summits_df["summitCode"].isin(activated_codes)]
 
-        if hillset == "Munros":
-            for _, row in non_sota_munros.iterrows():
-                popup = f"<b>{row['name']}</b><br>Elevation: {row['Elevation']} m"
+        render_maps(df_call, unactivated, hillset)
 
-                folium.CircleMarker(
-                    location=[row["lat"], row["lon"]],
-                    popup=popup,
-                    tooltip=row["name"],
-                    radius=5,
-                    color="grey",
-                    fill=True,
-                    fill_color="grey",
-                    fill_opacity=0.6,
-                ).add_to(m2)
+    else:
+        st.info("Select an activator from the table to see maps.")
 
-        st_folium(m2, width="stretch", returned_objects=[])
-
-else:
-    st.info("Select an activator from the table to see maps.")
+activator_section(summary, df_year, summits_df, hillset_codes, selected_year, hillset)
 
 # ----------------------
 # Historical section
@@ -365,22 +492,7 @@ else:
 
 st.header("Historical Annual Data")
 
-historical = (
-    df_hillset
-    .drop_duplicates(subset=["userId", "summitCode", "year"])
-    .groupby(["year", "Callsign"])
-    .size()
-    .reset_index(name="Summits")
-)
-
-top_per_year = (
-    historical
-    .sort_values(["year", "Summits"], ascending=[True, False])
-    .groupby("year")
-    .head(1)
-    .sort_values("year", ascending=False)
-    .rename(columns={"year": "Year"})
-)
+top_per_year, yearly_totals = all_historical(last_modified)[hillset]
 
 col1, col2 = st.columns(2)
 
@@ -389,14 +501,6 @@ with col1:
     st.dataframe(top_per_year, hide_index=True)
 
 with col2:
-    yearly_totals = (
-        df_hillset
-        .drop_duplicates(subset=["userId", "summitCode", "year"])
-        .groupby("year")
-        .size()
-        .reset_index(name="Total Activations")
-    )
-
     st.subheader("Total activations per year")
     st.bar_chart(yearly_totals.set_index("year"))
 
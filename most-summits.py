@@ -1,7 +1,5 @@
-import json
-import csv
-from collections import defaultdict
-from datetime import datetime
+import orjson
+import pandas as pd
 
 # ---------- CONFIG ----------
 INPUT_FILE = "gm_sota_data.json"
@@ -11,74 +9,82 @@ POINT_VALUES = [1, 2, 4, 6, 8, 10]
 
 
 def load_data(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
 
 
-def normalise_date(date_str):
+def normalise_dates(dates):
     """
     Convert '2025-08-17T00:00:00Z' -> '2025-08-17'
     """
-    return datetime.fromisoformat(
-        date_str.replace("Z", "+00:00")
-    ).date().isoformat()
+    dates = pd.Series(dates)
+
+    # Dates are ISO 8601, so the date part is the first 10 characters
+    is_iso = dates.str.match(r"\d{4}-\d{2}-\d{2}T", na=False)
+    if not is_iso.all():
+        raise ValueError(f"Unexpected activation date: {dates[~is_iso].iloc[0]!r}")
+
+    return dates.str.slice(0, 10)
 
 
 def main():
     data = load_data(INPUT_FILE)
 
-    # (date, callsign) -> { summit_code: points }
-    activations_by_day = defaultdict(dict)
+    dates, callsigns, summit_codes, summit_points = [], [], [], []
 
     for region in data.get("regions", {}).values():
         for summit_code, summit_data in region.get("summits", {}).items():
 
-            summit_points = summit_data["summit"]["points"]
+            points = summit_data["summit"]["points"]
 
             for act in summit_data.get("activations", []):
-                date = normalise_date(act["activationDate"])
                 callsign = act.get("Callsign") or act.get("ownCallsign")
 
                 if not callsign:
                     continue
 
-                key = (date, callsign)
-                # Avoid double-counting the same summit
-                activations_by_day[key][summit_code] = summit_points
-
-    rows = []
-    for (date, callsign), summits in activations_by_day.items():
-
-        # Initialise point buckets
-        point_counts = {p: 0 for p in POINT_VALUES}
-
-        for pts in summits.values():
-            if pts in point_counts:
-                point_counts[pts] += 1
-
-        total_points = sum(summits.values())
-
-        row = {
-            "date": date,
-            "callsign": callsign,
-            "number_of_summits": len(summits),
-            "total_points": total_points,
-            "summits": ", ".join(sorted(summits.keys()))
-        }
+                dates.append(act["activationDate"])
+                callsigns.append(callsign)
+                summit_codes.append(summit_code)
+                summit_points.append(points)
+
+    df = pd.DataFrame({
+        "date": normalise_dates(dates),
+        "callsign": callsigns,
+        "summit_code": summit_codes,
+        "points": summit_points,
+    })
+
+    # Avoid double-counting the same summit
+    df = df.drop_duplicates(["date", "callsign", "summit_code"])
+
+    # (date, callsign) -> totals, in order of first appearance
+    result = df.groupby(["date", "callsign"], sort=False).agg(
+        number_of_summits=("summit_code", "size"),
+        total_points=("points", "sum"),
+        summits=("summit_code", lambda s: ", ".join(sorted(s))),
+    )
 
-        # Add point columns
-        for p in POINT_VALUES:
-            row[f"{p}pt"] = point_counts[p]
+    # Point buckets
+    point_counts = (
+        df.pivot_table(
+            index=["date", "callsign"],
+            columns="points",
+            values="summit_code",
+            aggfunc="size",
+            fill_value=0,
+        )
+        .reindex(columns=POINT_VALUES, fill_value=0)
+        .rename(columns=lambda p: f"{p}pt")
+    )
 
-        rows.append(row)
+    result = result.join(point_counts).reset_index()
 
     # Sort: most summits, then most points, then date
-    rows.sort(
-        key=lambda r: (
-            -r["number_of_summits"],
-            -r["total_points"],
-            r["date"]
-        )
+    result = result.sort_values(
+        ["number_of_summits", "total_points", "date"],
+        ascending=[False, False, True],
+        kind="stable",
     )
 
     # CSV field order
@@ -88,12 +94,9 @@ def main():
         + ["summits"]
     )
 
-    with open(OUTPUT_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    result.to_csv(OUTPUT_FILE, index=False, columns=fieldnames, encoding="utf-8")
 
-    print(f"Written {len(rows)} rows to {OUTPUT_FILE}")
+    print(f"Written {len(result)} rows to {OUTPUT_FILE}")
 
 
 if __name__ == "__main__":